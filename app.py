@@ -13,21 +13,63 @@ Features:
   - Token count estimates
 """
 
-import json
+import asyncio
+import functools
+import gzip
+import hashlib
+import logging
+import os
+import re
 import sqlite3
-import uuid
 from datetime import datetime, timezone
+from email.utils import formatdate
 from pathlib import Path
 from contextlib import asynccontextmanager
 
+import aiosqlite
 import httpx
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+import orjson
+from aiosqlitepool import SQLiteConnectionPool
+from fastapi import FastAPI, Request, HTTPException, Depends
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from fastapi.staticfiles import StaticFiles
+
+try:
+    import brotli  # optional: smaller page than gzip when installed
+except ImportError:
+    brotli = None
+
+log = logging.getLogger("jarvischat")
 
 # --- Configuration ---
 OLLAMA_BASE = "http://localhost:11434"
 DB_PATH = Path(__file__).parent / "jarvischat.db"
+STATIC_DIR = Path(__file__).parent / "static"
+DB_POOL_SIZE = 5
+DB_STATEMENT_CACHE = 256  # prepared statements kept per pooled connection
+WAL_CHECKPOINT_INTERVAL = 600  # seconds
 DEFAULT_MODEL = "deepseek-coder:6.7b"
+HISTORY_LIMIT = 50  # default number of past messages sent with each chat turn
+
+# Tokens are coalesced into one SSE frame until either limit is hit
+SSE_BATCH_TOKENS = 16
+SSE_BATCH_WINDOW = 0.015  # seconds
+
+# "User" already matches "User:" and "\nUser", so those add scanning cost without effect
+STOP_TOKENS = ["User", "Assistant:"]
+
+# SQLite tuning: WAL + synchronous=NORMAL turns each commit into a WAL append
+# instead of a rollback-journal fsync dance. Only journal_mode = WAL persists in
+# the database file; the rest (mmap_size included) are per-connection, so every
+# connection applies the full list.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",      # 64 MiB
+    "PRAGMA mmap_size = 1073741824",   # 1 GiB
+    "PRAGMA busy_timeout = 5000",
+)
 
 # --- Default Profile ---
 DEFAULT_PROFILE = """You are a coding companion running locally on a machine called "jarvis".
@@ -59,27 +101,38 @@ DEFAULT_PROFILE = """You are a coding companion running locally on a machine cal
 - Use Rust, Python, or bash unless another language is specifically needed
 - Explain trade-offs when multiple approaches exist
 - Don't repeat information the user clearly already knows"""
+DEFAULT_PROFILE_JSON = orjson.dumps({"content": DEFAULT_PROFILE})
 
 # --- Default System Prompt Presets ---
-DEFAULT_PRESETS = [
+# Fixed ids: seeding needs no uuid generation and the defaults keep the same id across reinstalls
+DEFAULT_PRESETS = (
     {
+        "id": "95ba8c66-e4e6-416d-ac0e-f116fa973337",
         "name": "Coding Companion",
         "prompt": "You are a senior software engineer and coding companion. Focus on writing clean, efficient, well-documented code. Provide complete working examples. Explain architectural decisions and trade-offs. Prefer Rust, Python, and bash."
     },
     {
+        "id": "05f82de2-3d7d-492f-b9fc-943a57edc341",
         "name": "Linux Sysadmin",
         "prompt": "You are an experienced Linux systems administrator. Focus on command-line solutions, systemd services, networking, storage, and security. Prefer Debian/Ubuntu conventions. Be concise and direct."
     },
     {
+        "id": "b1fbb603-e71a-4f14-9b0d-8f985678a421",
         "name": "General Assistant",
         "prompt": "You are a helpful general-purpose assistant. Be clear and concise."
     }
-]
+)
+
+def new_id():
+    """Random 128-bit hex id; skips building a uuid.UUID object just to stringify it"""
+    return os.urandom(16).hex()
 
 # --- Database Setup ---
 def init_db():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
     conn.execute("""
         CREATE TABLE IF NOT EXISTS conversations (
             id TEXT PRIMARY KEY,
@@ -122,243 +175,425 @@ def init_db():
         )
     """)
 
+    # History reads filter by conversation and order by id; the sidebar orders by updated_at
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_conv_id ON messages(conversation_id, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_conv_updated ON conversations(updated_at DESC)")
+
+    now = datetime.now(timezone.utc).isoformat()
+
     # Seed default profile if empty
     existing = conn.execute("SELECT id FROM profile WHERE id = 1").fetchone()
     if not existing:
-        now = datetime.now(timezone.utc).isoformat()
         conn.execute("INSERT INTO profile (id, content, updated_at) VALUES (1, ?, ?)",
                       (DEFAULT_PROFILE, now))
 
     # Seed default presets if empty
     existing_presets = conn.execute("SELECT COUNT(*) as c FROM system_presets").fetchone()
     if existing_presets["c"] == 0:
-        now = datetime.now(timezone.utc).isoformat()
-        for preset in DEFAULT_PRESETS:
-            conn.execute(
-                "INSERT INTO system_presets (id, name, prompt, is_default, created_at) VALUES (?, ?, ?, 1, ?)",
-                (str(uuid.uuid4()), preset["name"], preset["prompt"], now)
-            )
+        conn.executemany(
+            "INSERT INTO system_presets (id, name, prompt, is_default, created_at) VALUES (?, ?, ?, 1, ?)",
+            [(preset["id"], preset["name"], preset["prompt"], now) for preset in DEFAULT_PRESETS]
+        )
 
     # Default settings
     defaults = {
         "profile_enabled": "true",
         "default_model": DEFAULT_MODEL,
+        "history_limit": str(HISTORY_LIMIT),
     }
-    for key, value in defaults.items():
-        existing = conn.execute("SELECT key FROM settings WHERE key = ?", (key,)).fetchone()
-        if not existing:
-            conn.execute("INSERT INTO settings (key, value) VALUES (?, ?)", (key, value))
+    conn.executemany("INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)", defaults.items())
 
     conn.commit()
+    conn.execute("ANALYZE")
+
+    # Warm the prompt cache so the first chat after startup skips the lookup
+    store_prompt_context(conn.execute(SQL_SELECT_PROMPT_CONTEXT).fetchall())
     conn.close()
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
+async def connect_db():
+    """Connection factory for the pool; PRAGMAs are applied once per connection"""
+    conn = await aiosqlite.connect(DB_PATH, cached_statements=DB_STATEMENT_CACHE)
+    conn.row_factory = aiosqlite.Row
+    for pragma in SQLITE_PRAGMAS:
+        await conn.execute(pragma)
+    await conn.execute("PRAGMA foreign_keys = ON")
     return conn
 
+async def get_db(request: Request):
+    async with request.app.state.pool.connection() as conn:
+        yield conn
+
+# --- Hot-path SQL ---
+# Pooled connections are long-lived, so their statement caches stay warm;
+# keeping the SQL in one place guarantees the same text hits the cache.
+SQL_INSERT_MSG = "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)"
+SQL_INSERT_CONV = "INSERT INTO conversations (id, title, model, created_at, updated_at) VALUES (?, ?, ?, ?, ?)"
+SQL_UPDATE_CONV_TS = "UPDATE conversations SET updated_at = ? WHERE id = ?"
+SQL_CONV_EXISTS = "SELECT 1 FROM conversations WHERE id = ?"
+SQL_SELECT_HISTORY = """SELECT role, content FROM (
+    SELECT id, role, content FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?
+) ORDER BY id ASC"""
+SQL_SELECT_SETTINGS = "SELECT key, value FROM settings"
+SQL_SELECT_PRESETS = "SELECT * FROM system_presets ORDER BY is_default DESC, name ASC"
+# Cache-miss loader: profile and the one setting we need in a single round-trip
+SQL_SELECT_PROMPT_CONTEXT = """
+    SELECT 'profile' AS kind, content AS value FROM profile WHERE id = 1
+    UNION ALL
+    SELECT key, value FROM settings WHERE key = 'profile_enabled'
+"""
+
+# --- Read Cache ---
+# Profile, settings and presets change rarely but are read constantly (the
+# profile on every chat turn), so keep them in memory. A value of None means
+# "reload on next read"; writers call invalidate_cache() after committing.
+_cache = {"profile": None, "profile_enabled": True, "settings": None, "presets": None}
+_cache_lock = asyncio.Lock()
+
+async def invalidate_cache(*keys):
+    async with _cache_lock:
+        for key in keys:
+            _cache[key] = None
+
+def store_prompt_context(rows):
+    """Fill the profile cache from SQL_SELECT_PROMPT_CONTEXT rows; caller holds _cache_lock or runs at startup"""
+    context = {row["kind"]: row["value"] for row in rows}
+    _cache["profile_enabled"] = context.get("profile_enabled", "true") == "true"
+    _cache["profile"] = context.get("profile", "")
+
+async def cached_settings(db):
+    async with _cache_lock:
+        if _cache["settings"] is None:
+            rows = await db.execute_fetchall(SQL_SELECT_SETTINGS)
+            _cache["settings"] = {row["key"]: row["value"] for row in rows}
+        return _cache["settings"]
+
+async def cached_presets(db):
+    async with _cache_lock:
+        if _cache["presets"] is None:
+            rows = await db.execute_fetchall(SQL_SELECT_PRESETS)
+            _cache["presets"] = [dict(r) for r in rows]
+        return _cache["presets"]
+
+
+def optimize_db():
+    """Refresh query planner stats; 0x10002 checks every table, not just ones this connection used"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA optimize = 0x10002")
+    conn.close()
+
+async def checkpoint_wal(pool):
+    """Periodically fold the WAL back into the database so it can't grow without bound"""
+    while True:
+        await asyncio.sleep(WAL_CHECKPOINT_INTERVAL)
+        # A busy pool or a locked database only skips this round; the loop keeps running
+        # (CancelledError is not an Exception, so shutdown still stops it)
+        try:
+            async with pool.connection() as conn:
+                await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except Exception:
+            log.exception("WAL checkpoint failed")
+
 # --- App Lifecycle ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    app.state.pool = SQLiteConnectionPool(connect_db, pool_size=DB_POOL_SIZE)
+    # One long-lived client keeps the Ollama connection warm across requests
+    app.state.http = httpx.AsyncClient(
+        base_url=OLLAMA_BASE,
+        timeout=httpx.Timeout(300.0, connect=10.0),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=30),
+    )
+    checkpointer = asyncio.create_task(checkpoint_wal(app.state.pool))
     yield
+    checkpointer.cancel()
+    await app.state.http.aclose()
+    await app.state.pool.close()
+    optimize_db()
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered by orjson (FastAPI's own ORJSONResponse is deprecated)"""
+    def render(self, content):
+        return orjson.dumps(content)
+
+app = FastAPI(title="JarvisChat", lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# --- Frontend ---
+# The page lives in static/index.html; it is read once at startup and served
+# from memory below. Other files under static/ are served by StaticFiles.
+HTML_PAGE = (STATIC_DIR / "index.html").read_text(encoding="utf-8")
+
+# static/fonts is filled by fetch_fonts.sh; drop the url() of any font that is not
+# there, so browsers fall back without requesting a 404 for each face
+FONT_URL = re.compile(r", url\('/static/fonts/([\w.-]+)'\) format\('woff2'\)")
+HTML_PAGE = FONT_URL.sub(lambda m: m[0] if (STATIC_DIR / "fonts" / m[1]).is_file() else "", HTML_PAGE)
+
+# Optional: strip whitespace/comments from the markup, CSS and JS before compressing
+try:
+    from minify_html import minify
+    HTML_PAGE = minify(HTML_PAGE, minify_css=True, minify_js=True, keep_closing_tags=True)
+except ImportError:
+    pass
+
+# The page never changes at runtime: encode, compress and fingerprint it once
+HTML_BYTES = HTML_PAGE.encode()
+HTML_GZIP = gzip.compress(HTML_BYTES, 9)
+HTML_BR = brotli.compress(HTML_BYTES, quality=11) if brotli else None
+HTML_HASH = hashlib.sha1(HTML_BYTES).hexdigest()
+# (Content-Encoding, body, ETag) in order of preference. Each encoding is a
+# different byte sequence, so each gets its own strong ETag.
+HTML_VARIANTS = [
+    (encoding, body, '"' + HTML_HASH + suffix + '"')
+    for encoding, body, suffix in (("br", HTML_BR, "-br"), ("gzip", HTML_GZIP, "-gz"), (None, HTML_BYTES, ""))
+    if body is not None
+]
+# max-age=0 + stale-while-revalidate: repeat visits render from cache at once and
+# revalidate in the background, so an upgraded page is picked up on the next load
+HTML_CACHE_HEADERS = {
+    "Last-Modified": formatdate((STATIC_DIR / "index.html").stat().st_mtime, usegmt=True),
+    "Cache-Control": "public, max-age=0, stale-while-revalidate=86400",
+    "Vary": "Accept-Encoding",
+}
 
-app = FastAPI(title="JarvisChat", lifespan=lifespan)
+class StaticAssets(StaticFiles):
+    """StaticFiles that lets browsers keep fonts for a year; they never change under a given name"""
+    def file_response(self, full_path, *args, **kwargs):
+        response = super().file_response(full_path, *args, **kwargs)
+        if str(full_path).endswith(".woff2"):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
 
-# --- API Routes ---
+app.mount("/static", StaticAssets(directory=STATIC_DIR), name="static")
 
-@app.get("/", response_class=HTMLResponse)
-async def index():
-    return HTML_PAGE
+# --- API Routes ---
+# Routes returning lists of rows build their ORJSONResponse directly so the
+# rows skip FastAPI's jsonable_encoder walk.
+
+def accepted_encodings(header):
+    """Content codings listed in Accept-Encoding, minus those refused with q=0"""
+    accepted = set()
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+@app.get("/")
+async def index(request: Request):
+    accepted = accepted_encodings(request.headers.get("accept-encoding", ""))
+    encoding, body, etag = next(v for v in HTML_VARIANTS if v[0] is None or v[0] in accepted)
+    headers = {**HTML_CACHE_HEADERS, "ETag": etag}
+    if etag in {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}:
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="text/html", headers=headers)
 
 @app.get("/api/models")
-async def list_models():
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{OLLAMA_BASE}/api/tags", timeout=10)
-            return resp.json()
-        except httpx.ConnectError:
-            raise HTTPException(status_code=502, detail="Cannot connect to Ollama. Is it running?")
+async def list_models(request: Request):
+    try:
+        resp = await request.app.state.http.get("/api/tags", timeout=10)
+        return resp.json()
+    except httpx.ConnectError:
+        raise HTTPException(status_code=502, detail="Cannot connect to Ollama. Is it running?")
 
 @app.get("/api/ps")
-async def running_models():
-    async with httpx.AsyncClient() as client:
-        try:
-            resp = await client.get(f"{OLLAMA_BASE}/api/ps", timeout=10)
-            return resp.json()
-        except httpx.ConnectError:
-            raise HTTPException(status_code=502, detail="Cannot connect to Ollama.")
+async def running_models(request: Request):
+    try:
+        resp = await request.app.state.http.get("/api/ps", timeout=10)
+        return resp.json()
+    except httpx.ConnectError:
+        raise HTTPException(status_code=502, detail="Cannot connect to Ollama.")
 
 # --- Profile ---
 
 @app.get("/api/profile")
-async def get_profile():
-    db = get_db()
-    row = db.execute("SELECT content, updated_at FROM profile WHERE id = 1").fetchone()
-    db.close()
+async def get_profile(db=Depends(get_db)):
+    async with db.execute("SELECT content, updated_at FROM profile WHERE id = 1") as cur:
+        row = await cur.fetchone()
     if row:
         return {"content": row["content"], "updated_at": row["updated_at"]}
     return {"content": "", "updated_at": ""}
 
 @app.put("/api/profile")
-async def update_profile(request: Request):
-    body = await request.json()
+async def update_profile(request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
     now = datetime.now(timezone.utc).isoformat()
-    db = get_db()
-    db.execute("UPDATE profile SET content = ?, updated_at = ? WHERE id = 1",
-               (body["content"], now))
-    db.commit()
-    db.close()
+    await db.execute("UPDATE profile SET content = ?, updated_at = ? WHERE id = 1",
+                     (body["content"], now))
+    await db.commit()
+    await invalidate_cache("profile")
+    # Memoized prompts all embed the old profile text; drop them rather than let them age out
+    _assemble_system_prompt.cache_clear()
     return {"status": "ok", "updated_at": now}
 
 @app.get("/api/profile/default")
 async def get_default_profile():
-    return {"content": DEFAULT_PROFILE}
+    return Response(DEFAULT_PROFILE_JSON, media_type="application/json")
 
 # --- Settings ---
 
 @app.get("/api/settings")
-async def get_settings():
-    db = get_db()
-    rows = db.execute("SELECT key, value FROM settings").fetchall()
-    db.close()
-    return {row["key"]: row["value"] for row in rows}
+async def get_settings(db=Depends(get_db)):
+    return await cached_settings(db)
 
 @app.put("/api/settings")
-async def update_settings(request: Request):
-    body = await request.json()
-    db = get_db()
-    for key, value in body.items():
-        db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, str(value)))
-    db.commit()
-    db.close()
+async def update_settings(request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
+    if "history_limit" in body:
+        # LIMIT -1 would mean unlimited history, and anything int() can't read back
+        # in chat() would silently fall back to the default; store it normalised
+        value = body["history_limit"]
+        if isinstance(value, str) and value.isascii() and value.isdigit():
+            value = int(value)
+        if type(value) is not int or value < 1:  # bool is an int subclass; reject it too
+            raise HTTPException(status_code=400, detail="history_limit must be a positive integer")
+        body["history_limit"] = str(value)
+    await db.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         [(key, str(value)) for key, value in body.items()])
+    await db.commit()
+    await invalidate_cache("settings")
+    if "profile_enabled" in body:
+        # The only setting the system prompt reads; others leave the prompt cache warm
+        await invalidate_cache("profile")
     return {"status": "ok"}
 
 # --- System Presets ---
 
 @app.get("/api/presets")
-async def list_presets():
-    db = get_db()
-    rows = db.execute("SELECT * FROM system_presets ORDER BY is_default DESC, name ASC").fetchall()
-    db.close()
-    return [dict(r) for r in rows]
+async def list_presets(db=Depends(get_db)):
+    return ORJSONResponse(await cached_presets(db))
 
 @app.post("/api/presets")
-async def create_preset(request: Request):
-    body = await request.json()
-    preset_id = str(uuid.uuid4())
+async def create_preset(request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
+    preset_id = new_id()
     now = datetime.now(timezone.utc).isoformat()
-    db = get_db()
-    db.execute(
+    await db.execute(
         "INSERT INTO system_presets (id, name, prompt, is_default, created_at) VALUES (?, ?, ?, 0, ?)",
         (preset_id, body["name"], body["prompt"], now)
     )
-    db.commit()
-    db.close()
+    await db.commit()
+    await invalidate_cache("presets")
     return {"id": preset_id, "name": body["name"], "prompt": body["prompt"]}
 
 @app.put("/api/presets/{preset_id}")
-async def update_preset(preset_id: str, request: Request):
-    body = await request.json()
-    db = get_db()
-    db.execute("UPDATE system_presets SET name = ?, prompt = ? WHERE id = ?",
-               (body["name"], body["prompt"], preset_id))
-    db.commit()
-    db.close()
+async def update_preset(preset_id: str, request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
+    await db.execute("UPDATE system_presets SET name = ?, prompt = ? WHERE id = ?",
+                     (body["name"], body["prompt"], preset_id))
+    await db.commit()
+    await invalidate_cache("presets")
     return {"status": "ok"}
 
 @app.delete("/api/presets/{preset_id}")
-async def delete_preset(preset_id: str):
-    db = get_db()
-    db.execute("DELETE FROM system_presets WHERE id = ? AND is_default = 0", (preset_id,))
-    db.commit()
-    db.close()
+async def delete_preset(preset_id: str, db=Depends(get_db)):
+    await db.execute("DELETE FROM system_presets WHERE id = ? AND is_default = 0", (preset_id,))
+    await db.commit()
+    await invalidate_cache("presets")
     return {"status": "ok"}
 
 # --- Conversation CRUD ---
 
 @app.get("/api/conversations")
-async def list_conversations():
-    db = get_db()
-    rows = db.execute("SELECT * FROM conversations ORDER BY updated_at DESC").fetchall()
-    db.close()
-    return [dict(r) for r in rows]
+async def list_conversations(db=Depends(get_db)):
+    rows = await db.execute_fetchall("SELECT * FROM conversations ORDER BY updated_at DESC")
+    return ORJSONResponse([dict(r) for r in rows])
 
 @app.post("/api/conversations")
-async def create_conversation(request: Request):
-    body = await request.json()
-    conv_id = str(uuid.uuid4())
+async def create_conversation(request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
+    conv_id = new_id()
     now = datetime.now(timezone.utc).isoformat()
     model = body.get("model", DEFAULT_MODEL)
     title = body.get("title", "New Chat")
-    db = get_db()
-    db.execute(
-        "INSERT INTO conversations (id, title, model, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-        (conv_id, title, model, now, now)
-    )
-    db.commit()
-    db.close()
+    await db.execute(SQL_INSERT_CONV, (conv_id, title, model, now, now))
+    await db.commit()
     return {"id": conv_id, "title": title, "model": model, "created_at": now, "updated_at": now}
 
 @app.get("/api/conversations/{conv_id}")
-async def get_conversation(conv_id: str):
-    db = get_db()
-    conv = db.execute("SELECT * FROM conversations WHERE id = ?", (conv_id,)).fetchone()
+async def get_conversation(conv_id: str, db=Depends(get_db)):
+    async with db.execute("SELECT * FROM conversations WHERE id = ?", (conv_id,)) as cur:
+        conv = await cur.fetchone()
     if not conv:
-        db.close()
         raise HTTPException(status_code=404, detail="Conversation not found")
-    messages = db.execute(
+    messages = await db.execute_fetchall(
         "SELECT * FROM messages WHERE conversation_id = ? ORDER BY id ASC", (conv_id,)
-    ).fetchall()
-    db.close()
-    return {"conversation": dict(conv), "messages": [dict(m) for m in messages]}
+    )
+    return ORJSONResponse({"conversation": dict(conv), "messages": [dict(m) for m in messages]})
 
 @app.put("/api/conversations/{conv_id}")
-async def update_conversation(conv_id: str, request: Request):
-    body = await request.json()
-    db = get_db()
+async def update_conversation(conv_id: str, request: Request, db=Depends(get_db)):
+    body = orjson.loads(await request.body())
     now = datetime.now(timezone.utc).isoformat()
     if "title" in body:
-        db.execute("UPDATE conversations SET title = ?, updated_at = ? WHERE id = ?",
-                    (body["title"], now, conv_id))
+        await db.execute("UPDATE conversations SET title = ?, updated_at = ? WHERE id = ?",
+                         (body["title"], now, conv_id))
     if "model" in body:
-        db.execute("UPDATE conversations SET model = ?, updated_at = ? WHERE id = ?",
-                    (body["model"], now, conv_id))
-    db.commit()
-    db.close()
+        await db.execute("UPDATE conversations SET model = ?, updated_at = ? WHERE id = ?",
+                         (body["model"], now, conv_id))
+    await db.commit()
     return {"status": "ok"}
 
 @app.delete("/api/conversations/{conv_id}")
-async def delete_conversation(conv_id: str):
-    db = get_db()
-    db.execute("DELETE FROM messages WHERE conversation_id = ?", (conv_id,))
-    db.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
-    db.commit()
-    db.close()
+async def delete_conversation(conv_id: str, db=Depends(get_db)):
+    await db.execute("DELETE FROM messages WHERE conversation_id = ?", (conv_id,))
+    await db.execute("DELETE FROM conversations WHERE id = ?", (conv_id,))
+    await db.commit()
     return {"status": "ok"}
 
 # --- Chat (streaming) ---
 
-def build_system_prompt(db, extra_prompt=""):
-    """Build the full system prompt: profile + preset/custom prompt"""
+# Keyed on the cached profile string itself: str caches its hash, so a hit costs
+# no O(profile) work. update_profile() clears it.
+@functools.lru_cache(maxsize=64)
+def _assemble_system_prompt(profile, profile_enabled, extra_prompt):
     parts = []
-
-    # Check if profile is enabled
-    settings = {row["key"]: row["value"] for row in db.execute("SELECT key, value FROM settings").fetchall()}
-    if settings.get("profile_enabled", "true") == "true":
-        profile = db.execute("SELECT content FROM profile WHERE id = 1").fetchone()
-        if profile and profile["content"].strip():
-            parts.append(profile["content"].strip())
+    if profile_enabled and profile.strip():
+        parts.append(profile.strip())
 
     if extra_prompt and extra_prompt.strip():
         parts.append(extra_prompt.strip())
 
     return "\n\n---\n\n".join(parts) if parts else ""
 
+async def build_system_prompt(db, extra_prompt=""):
+    """Build the full system prompt: profile + preset/custom prompt"""
+    async with _cache_lock:
+        if _cache["profile"] is None:
+            store_prompt_context(await db.execute_fetchall(SQL_SELECT_PROMPT_CONTEXT))
+        profile, profile_enabled = _cache["profile"], _cache["profile_enabled"]
+
+    return _assemble_system_prompt(profile, profile_enabled, extra_prompt or "")
+
+async def iter_ndjson(resp):
+    """Yield parsed objects from Ollama's NDJSON stream, splitting raw bytes instead of decoding lines to str"""
+    buf = bytearray()
+    async for data in resp.aiter_bytes():
+        buf.extend(data)
+        while (nl := buf.find(b"\n")) != -1:
+            line = bytes(buf[:nl])
+            del buf[:nl + 1]
+            if line.strip():
+                try:
+                    yield orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    pass
+    if buf.strip():
+        try:
+            yield orjson.loads(bytes(buf))
+        except orjson.JSONDecodeError:
+            pass
+
 @app.post("/api/chat")
 async def chat(request: Request):
-    body = await request.json()
+    body = orjson.loads(await request.body())
     conv_id = body.get("conversation_id")
     user_message = body.get("message", "").strip()
     model = body.get("model", DEFAULT_MODEL)
@@ -367,708 +602,148 @@ async def chat(request: Request):
     if not user_message:
         raise HTTPException(status_code=400, detail="Empty message")
 
-    db = get_db()
+    pool = request.app.state.pool
+    http = request.app.state.http
     now = datetime.now(timezone.utc).isoformat()
 
-    # Auto-create conversation if needed
-    if not conv_id:
-        conv_id = str(uuid.uuid4())
-        title = user_message[:80] + ("..." if len(user_message) > 80 else "")
-        db.execute(
-            "INSERT INTO conversations (id, title, model, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-            (conv_id, title, model, now, now)
+    is_new = not conv_id
+    if is_new:
+        conv_id = new_id()
+
+    # Pre-stream work is short; hold the pooled connection only for that
+    async with pool.connection() as db:
+        if is_new:
+            # Auto-create the conversation up front so the sidebar lists it while the
+            # reply streams; the messages are written together once the turn ends
+            title = user_message[:80] + ("..." if len(user_message) > 80 else "")
+            await db.execute(SQL_INSERT_CONV, (conv_id, title, model, now, now))
+            await db.commit()
+        elif not await db.execute_fetchall(SQL_CONV_EXISTS, (conv_id,)):
+            raise HTTPException(status_code=404, detail="Conversation not found")
+
+        # Only the newest messages are sent, so prompt size stays flat as a chat grows
+        settings = await cached_settings(db)
+        try:
+            history_limit = int(settings.get("history_limit", HISTORY_LIMIT))
+        except ValueError:
+            history_limit = 0
+        if history_limit < 1:  # stored before update_settings validated it
+            history_limit = HISTORY_LIMIT
+        history_rows = [] if is_new else await db.execute_fetchall(
+            SQL_SELECT_HISTORY, (conv_id, history_limit)
         )
-    else:
-        db.execute("UPDATE conversations SET updated_at = ? WHERE id = ?", (now, conv_id))
-
-    # Save user message
-    db.execute(
-        "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-        (conv_id, "user", user_message, now)
-    )
-    db.commit()
-
-    # Build message history
-    history_rows = db.execute(
-        "SELECT role, content FROM messages WHERE conversation_id = ? ORDER BY id ASC",
-        (conv_id,)
-    ).fetchall()
 
-    # Build system prompt (profile + preset)
-    system_prompt = build_system_prompt(db, preset_prompt)
-    db.close()
+        # Build system prompt (profile + preset)
+        system_prompt = await build_system_prompt(db, preset_prompt)
+
+    async def save_turn(assistant_msg=None):
+        """Persist the whole turn in one transaction: user message, reply, conversation timestamp"""
+        # One timestamp per turn, taken when the request arrived
+        rows = [(conv_id, "user", user_message, now)]
+        if assistant_msg is not None:
+            rows.append((conv_id, "assistant", assistant_msg, now))
+        async with pool.connection() as db:
+            await db.execute("BEGIN IMMEDIATE")
+            await db.execute(SQL_UPDATE_CONV_TS, (now, conv_id))
+            await db.executemany(SQL_INSERT_MSG, rows)
+            await db.commit()
+
+    def log_save_error(task):
+        """Saves are shielded and may outlive the request, so failures are logged here"""
+        if not task.cancelled() and task.exception() is not None:
+            log.error("Could not save chat turn of conversation %s", conv_id, exc_info=task.exception())
 
     messages = []
     if system_prompt:
         messages.append({"role": "system", "content": system_prompt})
     for row in history_rows:
         messages.append({"role": row["role"], "content": row["content"]})
+    messages.append({"role": "user", "content": user_message})
 
     ollama_payload = {
         "model": model,
         "messages": messages,
         "stream": True,
         "options": {
-            "stop": ["User", "User:", "Assistant:", "\nUser"]
+            "stop": STOP_TOKENS
         }
     }
 
+    # conversation_id is fixed for the stream, so only the tokens get encoded per frame
+    tokens_prefix = b'data: {"tokens":'
+    tokens_suffix = b',"conversation_id":' + orjson.dumps(conv_id) + b'}\n\n'
+
     async def stream_response():
         full_response = []
-        async with httpx.AsyncClient() as client:
-            try:
-                async with client.stream(
-                    "POST",
-                    f"{OLLAMA_BASE}/api/chat",
-                    json=ollama_payload,
-                    timeout=httpx.Timeout(300.0, connect=10.0)
-                ) as resp:
-                    async for line in resp.aiter_lines():
-                        if line.strip():
-                            try:
-                                chunk = json.loads(line)
-                                if "message" in chunk and "content" in chunk["message"]:
-                                    token = chunk["message"]["content"]
-                                    full_response.append(token)
-                                    yield f"data: {json.dumps({'token': token, 'conversation_id': conv_id})}\n\n"
-                                if chunk.get("done"):
-                                    assistant_msg = "".join(full_response)
-                                    db2 = get_db()
-                                    db2.execute(
-                                        "INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-                                        (conv_id, "assistant", assistant_msg, datetime.now(timezone.utc).isoformat())
-                                    )
-                                    db2.commit()
-                                    db2.close()
-                                    yield f"data: {json.dumps({'done': True, 'conversation_id': conv_id})}\n\n"
-                            except json.JSONDecodeError:
-                                pass
-            except httpx.ConnectError:
-                yield f"data: {json.dumps({'error': 'Cannot connect to Ollama. Is it running?'})}\n\n"
-            except Exception as e:
-                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+        pending = []
+        saved = False
+        save_task = None
+        loop = asyncio.get_running_loop()
+        last_flush = float("-inf")  # first token goes out immediately
+        try:
+            async with http.stream("POST", "/api/chat", json=ollama_payload) as resp:
+                chunks = iter_ndjson(resp)
+                # The read runs as a task so a batching timeout can't cancel it mid-chunk
+                next_chunk = None
+                try:
+                    while True:
+                        if next_chunk is None:
+                            next_chunk = asyncio.ensure_future(anext(chunks))
+                        # Held-back tokens go out once the window since the last flush ends,
+                        # even if Ollama pauses before the next token
+                        timeout = max(0.0, last_flush + SSE_BATCH_WINDOW - loop.time()) if pending else None
+                        ready, _ = await asyncio.wait((next_chunk,), timeout=timeout)
+                        if not ready:
+                            yield tokens_prefix + orjson.dumps(pending) + tokens_suffix
+                            pending.clear()
+                            last_flush = loop.time()
+                            continue
+                        try:
+                            chunk = next_chunk.result()
+                        except StopAsyncIteration:
+                            break
+                        next_chunk = None
+                        token = chunk.get("message", {}).get("content")
+                        if token:
+                            full_response.append(token)
+                            pending.append(token)
+                            now_t = loop.time()
+                            if len(pending) >= SSE_BATCH_TOKENS or now_t - last_flush > SSE_BATCH_WINDOW:
+                                yield tokens_prefix + orjson.dumps(pending) + tokens_suffix
+                                pending.clear()
+                                last_flush = now_t
+                        if chunk.get("done"):
+                            if pending:
+                                yield tokens_prefix + orjson.dumps(pending) + tokens_suffix
+                                pending.clear()
+                            # Shielded so a disconnect mid-write cannot roll the turn back
+                            save_task = asyncio.ensure_future(save_turn("".join(full_response)))
+                            save_task.add_done_callback(log_save_error)
+                            await asyncio.shield(save_task)
+                            saved = True
+                            yield b"data: " + orjson.dumps({"done": True, "conversation_id": conv_id}) + b"\n\n"
+                finally:
+                    if next_chunk is not None:
+                        next_chunk.cancel()
+        except httpx.ConnectError:
+            yield b"data: " + orjson.dumps({"error": "Cannot connect to Ollama. Is it running?"}) + b"\n\n"
+        except Exception as e:
+            yield b"data: " + orjson.dumps({"error": str(e)}) + b"\n\n"
+        finally:
+            # Stopped, disconnected or failed before the turn was stored: still keep the
+            # user's message. A turn save still running after a disconnect finishes on its
+            # own; one rejected by a constraint (conversation deleted) would be rejected again.
+            error = save_task.exception() if save_task is not None and save_task.done() else None
+            if not saved and (save_task is None or (error and not isinstance(error, sqlite3.IntegrityError))):
+                fallback = asyncio.ensure_future(save_turn())
+                fallback.add_done_callback(log_save_error)
+                try:
+                    await asyncio.shield(fallback)
+                except Exception:
+                    pass  # logged by log_save_error
 
     return StreamingResponse(stream_response(), media_type="text/event-stream")
 
-# =====================================================================
-# FRONTEND
-# =====================================================================
-
-HTML_PAGE = """<!DOCTYPE html>
-<html lang="en">
-<head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width, initial-scale=1.0">
-<title>JarvisChat</title>
-<link rel="preconnect" href="https://fonts.googleapis.com">
-<link href="https://fonts.googleapis.com/css2?family=JetBrains+Mono:wght@400;600&family=IBM+Plex+Sans:wght@300;400;500;600&display=swap" rel="stylesheet">
-<style>
-:root {
-    --bg-primary: #0a0e14;
-    --bg-secondary: #111820;
-    --bg-tertiary: #1a2230;
-    --bg-hover: #1e2a3a;
-    --text-primary: #c8d6e5;
-    --text-secondary: #7f8fa6;
-    --text-muted: #4a5568;
-    --accent: #48b5e0;
-    --accent-dim: #2a6f8a;
-    --accent-glow: rgba(72, 181, 224, 0.15);
-    --danger: #e74c3c;
-    --danger-hover: #c0392b;
-    --success: #2ecc71;
-    --border: #1e2a3a;
-    --scrollbar: #2a3a4a;
-    --radius: 8px;
-    --font-body: 'IBM Plex Sans', -apple-system, sans-serif;
-    --font-mono: 'JetBrains Mono', 'Consolas', monospace;
-}
-* { margin: 0; padding: 0; box-sizing: border-box; }
-body { font-family: var(--font-body); background: var(--bg-primary); color: var(--text-primary); height: 100vh; overflow: hidden; display: flex; }
-::-webkit-scrollbar { width: 6px; }
-::-webkit-scrollbar-track { background: transparent; }
-::-webkit-scrollbar-thumb { background: var(--scrollbar); border-radius: 3px; }
-
-/* Sidebar */
-.sidebar { width: 280px; min-width: 280px; background: var(--bg-secondary); border-right: 1px solid var(--border); display: flex; flex-direction: column; height: 100vh; }
-.sidebar-header { padding: 20px 16px 12px; border-bottom: 1px solid var(--border); }
-.sidebar-header h1 { font-family: var(--font-mono); font-size: 18px; font-weight: 600; color: var(--accent); letter-spacing: 1px; margin-bottom: 4px; }
-.sidebar-header .subtitle { font-size: 11px; color: var(--text-muted); font-family: var(--font-mono); margin-bottom: 12px; }
-.btn-row { display: flex; gap: 6px; }
-.new-chat-btn, .settings-btn { padding: 10px 14px; background: var(--accent-glow); border: 1px solid var(--accent-dim); border-radius: var(--radius); color: var(--accent); font-family: var(--font-body); font-size: 13px; font-weight: 500; cursor: pointer; transition: all 0.2s; }
-.new-chat-btn { flex: 1; }
-.settings-btn { padding: 10px 12px; }
-.new-chat-btn:hover, .settings-btn:hover { background: var(--accent-dim); color: #fff; }
-.conversation-list { flex: 1; overflow-y: auto; padding: 8px; }
-.conv-item { padding: 10px 12px; border-radius: var(--radius); cursor: pointer; margin-bottom: 2px; display: flex; justify-content: space-between; align-items: center; transition: background 0.15s; font-size: 13px; color: var(--text-secondary); }
-.conv-item:hover { background: var(--bg-hover); color: var(--text-primary); }
-.conv-item.active { background: var(--bg-tertiary); color: var(--text-primary); }
-.conv-item .conv-title { overflow: hidden; text-overflow: ellipsis; white-space: nowrap; flex: 1; }
-.conv-item .conv-delete { opacity: 0; color: var(--danger); cursor: pointer; padding: 2px 6px; font-size: 16px; }
-.conv-item:hover .conv-delete { opacity: 0.7; }
-.conv-item .conv-delete:hover { opacity: 1; }
-.sidebar-footer { padding: 12px 16px; border-top: 1px solid var(--border); font-size: 11px; color: var(--text-muted); font-family: var(--font-mono); }
-
-/* Main */
-.main { flex: 1; display: flex; flex-direction: column; height: 100vh; min-width: 0; }
-.topbar { display: flex; align-items: center; justify-content: space-between; padding: 12px 20px; border-bottom: 1px solid var(--border); background: var(--bg-secondary); gap: 12px; }
-.topbar-left { display: flex; align-items: center; gap: 12px; }
-.topbar-right { display: flex; align-items: center; gap: 8px; }
-.topbar select { background: var(--bg-tertiary); border: 1px solid var(--border); color: var(--text-primary); font-family: var(--font-mono); font-size: 13px; padding: 6px 10px; border-radius: var(--radius); cursor: pointer; }
-.topbar-label { font-size: 12px; color: var(--text-muted); font-family: var(--font-mono); text-transform: uppercase; letter-spacing: 1px; }
-.profile-badge { font-size: 11px; padding: 4px 10px; border-radius: 12px; font-family: var(--font-mono); cursor: pointer; border: none; transition: all 0.2s; }
-.profile-badge.on { background: rgba(46,204,113,0.15); color: var(--success); border: 1px solid rgba(46,204,113,0.3); }
-.profile-badge.off { background: rgba(231,76,60,0.15); color: var(--danger); border: 1px solid rgba(231,76,60,0.3); }
-.status-dot { width: 8px; height: 8px; border-radius: 50%; background: var(--success); display: inline-block; animation: pulse 2s infinite; }
-.status-dot.offline { background: var(--danger); animation: none; }
-@keyframes pulse { 0%,100%{opacity:1} 50%{opacity:0.4} }
-
-/* Modal */
-.modal-overlay { display:none; position:fixed; top:0;left:0;right:0;bottom:0; background:rgba(0,0,0,0.7); z-index:1000; align-items:center; justify-content:center; }
-.modal-overlay.visible { display:flex; }
-.modal { background:var(--bg-secondary); border:1px solid var(--border); border-radius:12px; width:90%; max-width:700px; max-height:85vh; overflow-y:auto; }
-.modal-header { display:flex; justify-content:space-between; align-items:center; padding:20px 24px 16px; border-bottom:1px solid var(--border); position:sticky; top:0; background:var(--bg-secondary); z-index:1; }
-.modal-header h2 { font-family:var(--font-mono); font-size:16px; color:var(--accent); }
-.modal-close { background:none; border:none; color:var(--text-muted); font-size:24px; cursor:pointer; }
-.modal-close:hover { color:var(--text-primary); }
-.modal-body { padding: 20px 24px; }
-.modal-section { margin-bottom: 24px; }
-.modal-section h3 { font-family:var(--font-mono); font-size:13px; color:var(--text-secondary); text-transform:uppercase; letter-spacing:1px; margin-bottom:8px; }
-.modal-section p.desc { font-size:12px; color:var(--text-muted); margin-bottom:10px; line-height:1.5; }
-.modal-section textarea { width:100%; background:var(--bg-tertiary); border:1px solid var(--border); color:var(--text-primary); font-family:var(--font-mono); font-size:12px; padding:12px; border-radius:var(--radius); resize:vertical; line-height:1.6; }
-.modal-section textarea:focus { outline:none; border-color:var(--accent-dim); }
-.token-count { font-size:11px; color:var(--text-muted); font-family:var(--font-mono); margin-top:4px; text-align:right; }
-.toggle-row { display:flex; align-items:center; justify-content:space-between; padding:8px 0; }
-.toggle-label { font-size:13px; }
-.toggle-switch { position:relative; width:44px; height:24px; background:var(--bg-tertiary); border:1px solid var(--border); border-radius:12px; cursor:pointer; transition:background 0.2s; }
-.toggle-switch.on { background:var(--accent-dim); border-color:var(--accent-dim); }
-.toggle-switch::after { content:''; position:absolute; top:2px; left:2px; width:18px; height:18px; background:var(--text-primary); border-radius:50%; transition:transform 0.2s; }
-.toggle-switch.on::after { transform:translateX(20px); }
-.btn-small { padding:6px 14px; border-radius:var(--radius); font-family:var(--font-mono); font-size:12px; cursor:pointer; border:1px solid var(--border); transition:all 0.2s; }
-.btn-save { background:var(--accent-dim); color:#fff; border-color:var(--accent-dim); }
-.btn-save:hover { background:var(--accent); }
-.btn-reset { background:transparent; color:var(--text-muted); }
-.btn-reset:hover { color:var(--danger); border-color:var(--danger); }
-.btn-bar { display:flex; gap:8px; margin-top:10px; }
-.preset-item { display:flex; align-items:center; gap:8px; padding:8px 10px; background:var(--bg-tertiary); border-radius:var(--radius); margin-bottom:6px; font-size:13px; }
-.preset-item .preset-name { flex:1; color:var(--text-primary); }
-.preset-item button { background:none; border:none; color:var(--text-muted); cursor:pointer; font-size:13px; padding:2px 4px; }
-.preset-item button:hover { color:var(--text-primary); }
-
-/* Chat */
-.chat-container { flex:1; overflow-y:auto; padding:20px; display:flex; flex-direction:column; gap:16px; }
-.welcome-screen { flex:1; display:flex; flex-direction:column; align-items:center; justify-content:center; color:var(--text-muted); text-align:center; gap:12px; }
-.welcome-screen .logo { font-family:var(--font-mono); font-size:48px; color:var(--accent-dim); opacity:0.5; }
-.welcome-screen p { font-size:14px; max-width:420px; line-height:1.6; }
-.message { display:flex; gap:12px; max-width:900px; width:100%; margin:0 auto; animation:fadeIn 0.2s ease; }
-@keyframes fadeIn { from{opacity:0;transform:translateY(6px)} to{opacity:1;transform:translateY(0)} }
-.message .avatar { width:32px; height:32px; min-width:32px; border-radius:6px; display:flex; align-items:center; justify-content:center; font-family:var(--font-mono); font-size:13px; font-weight:600; margin-top:2px; }
-.message.user .avatar { background:#1a3a5c; color:var(--accent); }
-.message.assistant .avatar { background:var(--accent-dim); color:#fff; }
-.message .content { flex:1; min-width:0; }
-.message .content .role-label { font-size:11px; font-weight:600; text-transform:uppercase; letter-spacing:0.5px; margin-bottom:4px; color:var(--text-muted); font-family:var(--font-mono); }
-.message .content .text { font-size:14px; line-height:1.65; word-wrap:break-word; overflow-wrap:break-word; }
-.message .content .text pre { background:var(--bg-primary); border:1px solid var(--border); border-radius:var(--radius); padding:12px; margin:8px 0; overflow-x:auto; font-family:var(--font-mono); font-size:13px; line-height:1.5; position:relative; }
-.message .content .text code { font-family:var(--font-mono); background:var(--bg-primary); padding:2px 5px; border-radius:3px; font-size:13px; }
-.message .content .text pre code { background:none; padding:0; }
-.copy-btn { position:absolute; top:6px; right:6px; background:var(--bg-tertiary); border:1px solid var(--border); color:var(--text-muted); font-family:var(--font-mono); font-size:11px; padding:3px 8px; border-radius:4px; cursor:pointer; }
-.copy-btn:hover { color:var(--text-primary); }
-.typing-indicator { display:inline-flex; gap:4px; padding:4px 0; }
-.typing-indicator span { width:6px; height:6px; background:var(--accent-dim); border-radius:50%; animation:blink 1.4s infinite; }
-.typing-indicator span:nth-child(2) { animation-delay:0.2s; }
-.typing-indicator span:nth-child(3) { animation-delay:0.4s; }
-@keyframes blink { 0%,80%,100%{opacity:0.3} 40%{opacity:1} }
-
-/* Input */
-.input-area { padding:16px 20px; border-top:1px solid var(--border); background:var(--bg-secondary); }
-.input-row-top { max-width:900px; margin:0 auto 8px; display:flex; gap:8px; align-items:center; }
-.input-row-top select { background:var(--bg-tertiary); border:1px solid var(--border); color:var(--text-secondary); font-family:var(--font-mono); font-size:11px; padding:4px 8px; border-radius:var(--radius); cursor:pointer; }
-.input-row-top .preset-label { font-size:11px; color:var(--text-muted); font-family:var(--font-mono); }
-.input-wrapper { max-width:900px; margin:0 auto; display:flex; gap:10px; align-items:flex-end; }
-.input-wrapper textarea { flex:1; background:var(--bg-tertiary); border:1px solid var(--border); color:var(--text-primary); font-family:var(--font-body); font-size:14px; padding:12px 14px; border-radius:var(--radius); resize:none; min-height:44px; max-height:200px; line-height:1.5; }
-.input-wrapper textarea:focus { outline:none; border-color:var(--accent-dim); }
-.input-wrapper textarea::placeholder { color:var(--text-muted); }
-.send-btn { padding:12px 20px; background:var(--accent-dim); border:none; border-radius:var(--radius); color:#fff; font-family:var(--font-mono); font-size:13px; font-weight:600; cursor:pointer; white-space:nowrap; }
-.send-btn:hover { background:var(--accent); }
-.stop-btn { padding:12px 20px; background:var(--danger); border:none; border-radius:var(--radius); color:#fff; font-family:var(--font-mono); font-size:13px; font-weight:600; cursor:pointer; }
-.stop-btn:hover { background:var(--danger-hover); }
-
-@media (max-width:768px) {
-    .sidebar { display:none; }
-    .topbar { padding:10px 14px; }
-    .chat-container { padding:12px; }
-    .input-area { padding:10px 12px; }
-}
-</style>
-</head>
-<body>
-
-<aside class="sidebar" id="sidebar">
-    <div class="sidebar-header">
-        <h1>&#9889; JarvisChat</h1>
-        <div class="subtitle">local coding companion</div>
-        <div class="btn-row">
-            <button class="new-chat-btn" onclick="newChat()">+ New Chat</button>
-            <button class="settings-btn" onclick="openSettings()">&#9881;</button>
-        </div>
-    </div>
-    <div class="conversation-list" id="convList"></div>
-    <div class="sidebar-footer">
-        <span id="ollamaStatus"><span class="status-dot offline"></span> checking...</span>
-    </div>
-</aside>
-
-<!-- Settings Modal -->
-<div class="modal-overlay" id="settingsModal">
-    <div class="modal">
-        <div class="modal-header">
-            <h2>Settings</h2>
-            <button class="modal-close" onclick="closeSettings()">&times;</button>
-        </div>
-        <div class="modal-body">
-            <div class="modal-section">
-                <h3>Profile / Memory</h3>
-                <p class="desc">This context is injected as a system prompt into every conversation. It tells the model who you are, your environment, and how you want responses. Edit freely.</p>
-                <div class="toggle-row">
-                    <span class="toggle-label">Inject profile into all chats</span>
-                    <div class="toggle-switch on" id="profileToggle" onclick="toggleProfile()"></div>
-                </div>
-                <textarea id="profileEditor" rows="18" spellcheck="false"></textarea>
-                <div class="token-count" id="profileTokenCount"></div>
-                <div class="btn-bar">
-                    <button class="btn-small btn-save" onclick="saveProfile()">Save Profile</button>
-                    <button class="btn-small btn-reset" onclick="resetProfile()">Reset to Default</button>
-                </div>
-            </div>
-
-            <div class="modal-section">
-                <h3>System Prompt Presets</h3>
-                <p class="desc">Presets add extra instructions on top of your profile. Select one in the chat to specialize behavior.</p>
-                <div id="presetList"></div>
-                <div class="btn-bar" style="margin-top:12px;">
-                    <button class="btn-small btn-save" onclick="addPreset()">+ Add Preset</button>
-                </div>
-            </div>
-
-            <div class="modal-section">
-                <h3>General</h3>
-                <div class="toggle-row">
-                    <span class="toggle-label">Default model</span>
-                    <select id="defaultModelSetting" onchange="saveDefaultModel()"></select>
-                </div>
-            </div>
-        </div>
-    </div>
-</div>
-
-<main class="main">
-    <div class="topbar">
-        <div class="topbar-left">
-            <span class="topbar-label">Model</span>
-            <select id="modelSelect"></select>
-        </div>
-        <div class="topbar-right">
-            <button class="profile-badge on" id="profileBadge" onclick="toggleProfile()" title="Toggle profile injection">PROFILE ON</button>
-        </div>
-    </div>
-
-    <div class="chat-container" id="chatContainer">
-        <div class="welcome-screen" id="welcomeScreen">
-            <div class="logo">&#9889;</div>
-            <p>JarvisChat &mdash; your local coding companion.<br>Profile context is injected automatically.<br>Pick a model and start building.</p>
-        </div>
-    </div>
-
-    <div class="input-area">
-        <div class="input-row-top">
-            <span class="preset-label">PRESET</span>
-            <select id="presetSelect">
-                <option value="">None (profile only)</option>
-            </select>
-        </div>
-        <div class="input-wrapper">
-            <textarea id="userInput" placeholder="Type a message... (Shift+Enter for new line)" rows="1" autofocus></textarea>
-            <button class="send-btn" id="sendBtn" onclick="sendMessage()">SEND</button>
-        </div>
-    </div>
-</main>
-
-<script>
-let currentConvId = null;
-let isStreaming = false;
-let abortController = null;
-let profileEnabled = true;
-let presets = [];
-
-document.addEventListener('DOMContentLoaded', async () => {
-    await loadModels();
-    await loadSettings();
-    await loadProfile();
-    await loadPresets();
-    await loadConversations();
-    checkOllamaStatus();
-    setInterval(checkOllamaStatus, 30000);
-});
-
-async function checkOllamaStatus() {
-    try {
-        const resp = await fetch('/api/ps');
-        const data = await resp.json();
-        const el = document.getElementById('ollamaStatus');
-        const models = data.models || [];
-        el.innerHTML = models.length > 0
-            ? '<span class="status-dot"></span> ' + models.map(m => m.name).join(', ')
-            : '<span class="status-dot"></span> Ollama ready';
-    } catch {
-        document.getElementById('ollamaStatus').innerHTML = '<span class="status-dot offline"></span> Ollama offline';
-    }
-}
-
-async function loadModels() {
-    try {
-        const resp = await fetch('/api/models');
-        const data = await resp.json();
-        const select = document.getElementById('modelSelect');
-        const settingSelect = document.getElementById('defaultModelSetting');
-        select.innerHTML = '';
-        settingSelect.innerHTML = '';
-        (data.models || []).forEach(m => {
-            const gb = (m.size / (1024*1024*1024)).toFixed(1);
-            select.add(new Option(m.name + ' (' + gb + 'GB)', m.name));
-            settingSelect.add(new Option(m.name, m.name));
-        });
-    } catch {}
-}
-
-async function loadSettings() {
-    try {
-        const resp = await fetch('/api/settings');
-        const s = await resp.json();
-        profileEnabled = s.profile_enabled !== 'false';
-        updateProfileUI();
-        if (s.default_model) {
-            document.getElementById('modelSelect').value = s.default_model;
-            document.getElementById('defaultModelSetting').value = s.default_model;
-        }
-    } catch {}
-}
-
-async function saveSettings() {
-    await fetch('/api/settings', {
-        method: 'PUT',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({ profile_enabled: profileEnabled ? 'true' : 'false' })
-    });
-}
-
-async function saveDefaultModel() {
-    const model = document.getElementById('defaultModelSetting').value;
-    await fetch('/api/settings', {
-        method: 'PUT',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({ default_model: model })
-    });
-}
-
-async function loadProfile() {
-    try {
-        const resp = await fetch('/api/profile');
-        const data = await resp.json();
-        document.getElementById('profileEditor').value = data.content || '';
-        updateTokenCount();
-    } catch {}
-}
-
-async function saveProfile() {
-    const content = document.getElementById('profileEditor').value;
-    await fetch('/api/profile', {
-        method: 'PUT',
-        headers: {'Content-Type': 'application/json'},
-        body: JSON.stringify({ content })
-    });
-    updateTokenCount();
-    // Flash the save button
-    const btn = event.target;
-    btn.textContent = 'Saved!';
-    setTimeout(() => btn.textContent = 'Save Profile', 1500);
-}
-
-async function resetProfile() {
-    if (!confirm('Reset profile to default? This overwrites your current profile.')) return;
-    try {
-        const resp = await fetch('/api/profile/default');
-        const data = await resp.json();
-        document.getElementById('profileEditor').value = data.content;
-        await saveProfile();
-    } catch {}
-}
-
-function toggleProfile() {
-    profileEnabled = !profileEnabled;
-    updateProfileUI();
-    saveSettings();
-}
-
-function updateProfileUI() {
-    const badge = document.getElementById('profileBadge');
-    const toggle = document.getElementById('profileToggle');
-    badge.className = 'profile-badge ' + (profileEnabled ? 'on' : 'off');
-    badge.textContent = profileEnabled ? 'PROFILE ON' : 'PROFILE OFF';
-    if (toggle) toggle.className = 'toggle-switch' + (profileEnabled ? ' on' : '');
-}
-
-function updateTokenCount() {
-    const text = document.getElementById('profileEditor').value;
-    const tokens = Math.round(text.length / 4);
-    document.getElementById('profileTokenCount').textContent = '~' + tokens + ' tokens';
-}
-
-document.getElementById('profileEditor')?.addEventListener('input', updateTokenCount);
-
-async function loadPresets() {
-    try {
-        const resp = await fetch('/api/presets');
-        presets = await resp.json();
-        renderPresetList();
-        renderPresetSelect();
-    } catch {}
-}
-
-function renderPresetList() {
-    const container = document.getElementById('presetList');
-    container.innerHTML = '';
-    presets.forEach(p => {
-        const div = document.createElement('div');
-        div.className = 'preset-item';
-        div.innerHTML = '<span class="preset-name">' + escapeHtml(p.name) + '</span>' +
-            '<div class="preset-actions">' +
-            '<button onclick="editPreset(\'' + p.id + '\')" title="Edit">&#9998;</button>' +
-            (p.is_default ? '' : '<button onclick="deletePreset(\'' + p.id + '\')" title="Delete">&times;</button>') +
-            '</div>';
-        container.appendChild(div);
-    });
-}
-
-function renderPresetSelect() {
-    const select = document.getElementById('presetSelect');
-    const current = select.value;
-    select.innerHTML = '<option value="">None (profile only)</option>';
-    presets.forEach(p => select.add(new Option(p.name, p.id)));
-    select.value = current;
-}
-
-async function addPreset() {
-    const name = prompt('Preset name:');
-    if (!name) return;
-    const p = prompt('System prompt text:');
-    if (!p) return;
-    await fetch('/api/presets', { method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({name, prompt:p}) });
-    await loadPresets();
-}
-
-async function editPreset(id) {
-    const preset = presets.find(p => p.id === id);
-    if (!preset) return;
-    const name = prompt('Preset name:', preset.name);
-    if (!name) return;
-    const p = prompt('System prompt:', preset.prompt);
-    if (p === null) return;
-    await fetch('/api/presets/' + id, { method:'PUT', headers:{'Content-Type':'application/json'}, body:JSON.stringify({name, prompt:p}) });
-    await loadPresets();
-}
-
-async function deletePreset(id) {
-    if (!confirm('Delete this preset?')) return;
-    await fetch('/api/presets/' + id, { method:'DELETE' });
-    await loadPresets();
-}
-
-function getSelectedPresetPrompt() {
-    const id = document.getElementById('presetSelect').value;
-    if (!id) return '';
-    const p = presets.find(x => x.id === id);
-    return p ? p.prompt : '';
-}
-
-function openSettings() { document.getElementById('settingsModal').classList.add('visible'); loadProfile(); }
-function closeSettings() { document.getElementById('settingsModal').classList.remove('visible'); }
-document.getElementById('settingsModal')?.addEventListener('click', e => { if (e.target.id === 'settingsModal') closeSettings(); });
-
-async function loadConversations() {
-    try {
-        const resp = await fetch('/api/conversations');
-        const convs = await resp.json();
-        const list = document.getElementById('convList');
-        list.innerHTML = '';
-        convs.forEach(c => {
-            const div = document.createElement('div');
-            div.className = 'conv-item' + (c.id === currentConvId ? ' active' : '');
-            div.innerHTML = '<span class="conv-title" onclick="loadConversation(\'' + c.id + '\')">' + escapeHtml(c.title) + '</span>' +
-                '<span class="conv-delete" onclick="event.stopPropagation(); deleteConversation(\'' + c.id + '\')">&times;</span>';
-            list.appendChild(div);
-        });
-    } catch {}
-}
-
-async function loadConversation(convId) {
-    try {
-        const resp = await fetch('/api/conversations/' + convId);
-        const data = await resp.json();
-        currentConvId = convId;
-        document.getElementById('modelSelect').value = data.conversation.model;
-        const container = document.getElementById('chatContainer');
-        container.innerHTML = '';
-        data.messages.forEach(msg => appendMessage(msg.role, msg.content, false));
-        scrollToBottom();
-        await loadConversations();
-    } catch {}
-}
-
-async function deleteConversation(convId) {
-    if (!confirm('Delete this conversation?')) return;
-    await fetch('/api/conversations/' + convId, { method:'DELETE' });
-    if (currentConvId === convId) { currentConvId = null; showWelcome(); }
-    await loadConversations();
-}
-
-function newChat() {
-    currentConvId = null;
-    showWelcome();
-    document.querySelectorAll('.conv-item').forEach(el => el.classList.remove('active'));
-}
-
-function showWelcome() {
-    document.getElementById('chatContainer').innerHTML =
-        '<div class="welcome-screen" id="welcomeScreen">' +
-        '<div class="logo">&#9889;</div>' +
-        '<p>JarvisChat &mdash; your local coding companion.<br>Profile context is injected automatically.<br>Pick a model and start building.</p>' +
-        '</div>';
-}
-
-async function sendMessage() {
-    const input = document.getElementById('userInput');
-    const message = input.value.trim();
-    if (!message || isStreaming) return;
-
-    const model = document.getElementById('modelSelect').value;
-    const presetPrompt = getSelectedPresetPrompt();
-
-    const welcome = document.getElementById('welcomeScreen');
-    if (welcome) welcome.remove();
-
-    appendMessage('user', message, true);
-    input.value = '';
-    input.style.height = 'auto';
-
-    const assistantDiv = appendMessage('assistant', '', true);
-    const textEl = assistantDiv.querySelector('.text');
-    textEl.innerHTML = '<div class="typing-indicator"><span></span><span></span><span></span></div>';
-    setStreamingState(true);
-
-    try {
-        abortController = new AbortController();
-        const resp = await fetch('/api/chat', {
-            method: 'POST',
-            headers: {'Content-Type':'application/json'},
-            body: JSON.stringify({ conversation_id: currentConvId, message, model, system_prompt: presetPrompt }),
-            signal: abortController.signal
-        });
-
-        const reader = resp.body.getReader();
-        const decoder = new TextDecoder();
-        let fullText = '';
-        let firstToken = true;
-
-        while (true) {
-            const { done, value } = await reader.read();
-            if (done) break;
-            const text = decoder.decode(value, { stream: true });
-            for (const line of text.split('\n')) {
-                if (!line.startsWith('data: ')) continue;
-                try {
-                    const data = JSON.parse(line.slice(6));
-                    if (data.error) { textEl.textContent = 'Error: ' + data.error; setStreamingState(false); return; }
-                    if (data.conversation_id && !currentConvId) { currentConvId = data.conversation_id; await loadConversations(); }
-                    if (data.token) {
-                        if (firstToken) { textEl.innerHTML = ''; firstToken = false; }
-                        fullText += data.token;
-                        textEl.innerHTML = renderMarkdown(fullText);
-                        scrollToBottom();
-                    }
-                    if (data.done) { addCopyButtons(assistantDiv); setStreamingState(false); await loadConversations(); checkOllamaStatus(); }
-                } catch {}
-            }
-        }
-    } catch (e) {
-        if (e.name === 'AbortError') textEl.innerHTML += '<br><em style="color:var(--text-muted)">[stopped]</em>';
-        else textEl.textContent = 'Error: ' + e.message;
-        setStreamingState(false);
-    }
-}
-
-function setStreamingState(streaming) {
-    isStreaming = streaming;
-    const btn = document.getElementById('sendBtn');
-    if (streaming) {
-        btn.textContent = 'STOP'; btn.className = 'stop-btn';
-        btn.onclick = () => { if (abortController) abortController.abort(); setStreamingState(false); };
-    } else {
-        btn.textContent = 'SEND'; btn.className = 'send-btn'; btn.onclick = sendMessage;
-    }
-}
-
-function appendMessage(role, content, animate) {
-    const container = document.getElementById('chatContainer');
-    const div = document.createElement('div');
-    div.className = 'message ' + role;
-    if (!animate) div.style.animation = 'none';
-    div.innerHTML = '<div class="avatar">' + (role==='user'?'YOU':'AI') + '</div>' +
-        '<div class="content"><div class="role-label">' + role + '</div>' +
-        '<div class="text">' + (content ? renderMarkdown(content) : '') + '</div></div>';
-    container.appendChild(div);
-    if (content && role === 'assistant') addCopyButtons(div);
-    scrollToBottom();
-    return div;
-}
-
-function renderMarkdown(text) {
-    let h = escapeHtml(text);
-    h = h.replace(/```(\w*)\n([\s\S]*?)```/g, '<pre data-lang="$1"><code>$2</code></pre>');
-    h = h.replace(/```([\s\S]*?)```/g, '<pre><code>$1</code></pre>');
-    h = h.replace(/`([^`]+)`/g, '<code>$1</code>');
-    h = h.replace(/\*\*(.+?)\*\*/g, '<strong>$1</strong>');
-    h = h.replace(/\*(.+?)\*/g, '<em>$1</em>');
-    h = h.replace(/\n/g, '<br>');
-    h = h.replace(/\\n/g, '<br>');
-    return h;
-}
-
-function addCopyButtons(msgDiv) {
-    msgDiv.querySelectorAll('pre').forEach(pre => {
-        if (pre.querySelector('.copy-btn')) return;
-        const btn = document.createElement('button');
-        btn.className = 'copy-btn';
-        btn.textContent = 'copy';
-        btn.onclick = () => {
-            navigator.clipboard.writeText(pre.querySelector('code')?.textContent || pre.textContent)
-                .then(() => { btn.textContent = 'copied!'; setTimeout(() => btn.textContent = 'copy', 1500); });
-        };
-        pre.style.position = 'relative';
-        pre.appendChild(btn);
-    });
-}
-
-function escapeHtml(t) { const d = document.createElement('div'); d.textContent = t; return d.innerHTML; }
-function scrollToBottom() { const c = document.getElementById('chatContainer'); c.scrollTop = c.scrollHeight; }
-
-const userInput = document.getElementById('userInput');
-userInput.addEventListener('input', function() { this.style.height = 'auto'; this.style.height = Math.min(this.scrollHeight, 200) + 'px'; });
-userInput.addEventListener('keydown', function(e) { if (e.key === 'Enter' && !e.shiftKey) { e.preventDefault(); sendMessage(); } });
-</script>
-</body>
-</html>
-"""
-
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8080)
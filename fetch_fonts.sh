@@ -0,0 +1,19 @@
+#!/usr/bin/env bash
+# Download the page's web fonts (latin subset, woff2) so they are served from
+# static/fonts instead of Google Fonts. Both families are SIL OFL 1.1.
+# Usage: bash fetch_fonts.sh [target_dir]
+
+FONT_DIR="${1:-$(dirname "$0")/static/fonts}"
+# Pinned fontsource release, so every install serves the same font files
+FONTSOURCE_VERSION="5.0.0"
+CDN="https://cdn.jsdelivr.net/npm/@fontsource"
+
+mkdir -p "$FONT_DIR"
+for font in jetbrains-mono:400 jetbrains-mono:600 ibm-plex-sans:300 ibm-plex-sans:400 ibm-plex-sans:500 ibm-plex-sans:600; do
+    family="${font%%:*}"
+    weight="${font##*:}"
+    dest="$FONT_DIR/$family-$weight.woff2"
+    [ -s "$dest" ] && continue
+    curl -fsSL -o "$dest" "$CDN/$family@$FONTSOURCE_VERSION/files/$family-latin-$weight-normal.woff2" \
+        || { rm -f "$dest"; echo "    could not fetch $family $weight, the fallback font is used"; }
+done
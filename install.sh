@@ -22,6 +22,11 @@ mkdir -p "$APP_DIR"
 echo "[+] Copying application files..."
 cp app.py "$APP_DIR/"
 cp requirements.txt "$APP_DIR/"
+cp -r static "$APP_DIR/"
+
+# Fetch the web fonts so the page does not load them from Google Fonts
+echo "[+] Fetching web fonts..."
+bash fetch_fonts.sh "$APP_DIR/static/fonts"
 
 # Create virtual environment
 echo "[+] Creating virtual environment..."